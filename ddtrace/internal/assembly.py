@@ -14,12 +14,15 @@
 # line                  ::= label | try_block_begin | try_block_end | instruction
 
 import dis
+import re
 import sys
 from types import CodeType
 import typing as t
 
 import bytecode as bc
 
+from ddtrace.internal.utils.cache import LFUCache
+
 
 if sys.version_info >= (3, 11):
     ParsedLine = t.Union[bc.Instr, bc.Label, bc.TryBegin, bc.TryEnd]
@@ -27,10 +30,46 @@ else:
     ParsedLine = t.Union[bc.Instr, bc.Label]
 
 
+# The stripped content of each line of source that is neither blank nor a
+# comment, so that these can be skipped without being extracted first. Lines
+# are split on the same boundaries as str.splitlines.
+_LINE_BREAKS = r"\n\r\x0b\x0c\x1c-\x1e\x85\u2028\u2029"
+_SOURCE_LINE_RE = re.compile(r"(?:\A|(?<=[%(b)s]))[^\S%(b)s]*([^#\s](?:[^%(b)s]*\S)?)" % {"b": _LINE_BREAKS})
+
+# A single pattern to classify (and split) a line, rather than trying each
+# kind of line in turn. Identifiers, label references and opcodes are
+# validated by the corresponding parsing methods.
+_INSTRUCTION_PATTERN = r"(?P<opcode>\S+)(?:\s+(?:\{(?P<bind_arg>.*)\}|(?P<arg>.+)))?"
+if sys.version_info >= (3, 11):
+    _LINE_RE = re.compile(
+        r"(?P<label>.*):"
+        r"|try\s+(?P<try_label_ref>\S+)(?P<try_lasti>\s+.+)?"
+        r"|(?P<tried>tried)"
+        r"|" + _INSTRUCTION_PATTERN
+    )
+else:
+    _LINE_RE = re.compile(r"(?P<label>.*):|" + _INSTRUCTION_PATTERN)
+
+
+_IDENT_RE = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*")
+
+_OPCODES = frozenset(dis.opmap)
+
+_DIGITS = frozenset("0123456789-")
+
+_expr_cache: t.Dict[str, CodeType] = {}
+
+# The globals in which opcode argument expressions are evaluated, i.e. those
+# of this module with the bytecode module available as "asm". These are built
+# on first use, once the module is fully defined.
+_expr_globals: t.Optional[t.Dict[str, t.Any]] = None
+
+
 def relocate(instrs: bc.Bytecode, lineno: int) -> bc.Bytecode:
     new_instrs = bc.Bytecode()
+    new_instrs._copy_attr_from(instrs)
     for i in instrs:
-        if isinstance(i, bc.Instr):
+        if type(i) is bc.Instr:
             new_i = i.copy()
             new_i.lineno = lineno
             new_instrs.append(new_i)
@@ -39,16 +78,52 @@ def relocate(instrs: bc.Bytecode, lineno: int) -> bc.Bytecode:
     return new_instrs
 
 
-def transform_instruction(opcode: str, arg: t.Any) -> t.Tuple[str, t.Any]:
-    # Handle pseudo-instructions
-    if sys.version_info >= (3, 12):
-        if opcode.upper() == "LOAD_METHOD":
-            opcode = "LOAD_ATTR"
-            arg = (True, arg)
-        elif opcode.upper() == "LOAD_ATTR" and not isinstance(arg, tuple):
-            arg = (False, arg)
+if sys.version_info >= (3, 12):
+    # Pseudo-instructions, and how they translate into actual instructions
+    _PSEUDO_INSTRUCTIONS: t.Dict[str, t.Callable[[t.Any], t.Tuple[str, t.Any]]] = {
+        "LOAD_METHOD": lambda arg: ("LOAD_ATTR", (True, arg)),
+        "LOAD_ATTR": lambda arg: ("LOAD_ATTR", arg if isinstance(arg, tuple) else (False, arg)),
+    }
+
+    def make_instruction(opcode: str, arg: t.Any, lineno: t.Optional[int] = None) -> bc.Instr:
+        # Handle pseudo-instructions
+        transform = _PSEUDO_INSTRUCTIONS.get(opcode)
+        if transform is not None:
+            opcode, arg = transform(arg)
+
+        return bc.Instr(opcode, arg, lineno=lineno)
 
-    return opcode, arg
+else:
+    # No pseudo-instructions to handle
+    make_instruction = bc.Instr
+
+
+_EXACT_KEY_TYPES = frozenset({int, bool, str, bytes, type(None)})
+
+
+def _bind_arg_key(value: t.Any) -> t.Hashable:
+    # Equal values might give different code objects, e.g. 1 and True, 0.0
+    # and -0.0, or (1,) and (True,), so we key values that compare by value
+    # by their exact type, recursively for containers.
+    kind = type(value)
+
+    if kind in _EXACT_KEY_TYPES:
+        return kind, value
+
+    if kind is float or kind is complex:
+        return kind, repr(value)
+
+    if kind is tuple:
+        return kind, tuple(_bind_arg_key(_) for _ in value)
+
+    if kind is frozenset:
+        return kind, frozenset(_bind_arg_key(_) for _ in value)
+
+    if kind.__hash__ is object.__hash__ and kind.__eq__ is object.__eq__:
+        # Compared by identity, e.g. functions
+        return kind, value
+
+    raise TypeError("cannot key bind argument of type %s" % kind.__name__)
 
 
 class BindOpArg(bc.Label):
@@ -74,24 +149,16 @@ class Assembly:
         self._instrs.filename = filename or __file__
         self._lineno = lineno
         self._bind_opargs: t.Dict[int, BindOpArg] = {}
+        self._compile_cache = LFUCache()
 
     def parse_ident(self, text: str) -> str:
-        if not text.isidentifier():
+        if _IDENT_RE.fullmatch(text) is None:
             raise ValueError("invalid identifier %s" % text)
 
         return text
 
-    def parse_number(self, text: str) -> t.Optional[int]:
-        try:
-            return int(text)
-        except ValueError:
-            return None
-
-    def parse_label(self, line: str) -> t.Optional[bc.Label]:
-        if not line.endswith(":"):
-            return None
-
-        label_ident = self.parse_ident(line[:-1])
+    def parse_label(self, text: str) -> bc.Label:
+        label_ident = self.parse_ident(text)
         if label_ident in self._labels:
             raise ValueError("label %s already defined" % label_ident)
 
@@ -122,15 +189,7 @@ class Assembly:
 
     if sys.version_info >= (3, 11):
 
-        def parse_try_begin(self, line: str) -> t.Optional[bc.TryBegin]:
-            try:
-                head, label_ref, *lasti = line.split(maxsplit=2)
-            except ValueError:
-                return None
-
-            if head != "try":
-                return None
-
+        def parse_try_begin(self, label_ref: str, lasti: bool = False) -> bc.TryBegin:
             if self._tb is not None:
                 raise ValueError("cannot start try block while another is open")
 
@@ -138,14 +197,11 @@ class Assembly:
             if label is None:
                 raise ValueError("invalid label reference for try block")
 
-            tb = self._tb = bc.TryBegin(label, push_lasti=bool(lasti))
+            tb = self._tb = bc.TryBegin(label, push_lasti=lasti)
 
             return tb
 
-        def parse_try_end(self, line: str) -> t.Optional[bc.TryEnd]:
-            if line != "tried":
-                return None
-
+        def parse_try_end(self) -> bc.TryEnd:
             if self._tb is None:
                 raise ValueError("cannot end try block while none is open")
 
@@ -155,82 +211,89 @@ class Assembly:
 
             return end
 
-    def parse_opcode(self, text: str) -> str:
-        opcode = text.upper()
-        if opcode not in dis.opmap:
-            raise ValueError("unknown opcode %s" % opcode)
-
-        return opcode
-
     def parse_expr(self, text: str) -> t.Any:
-        frame = sys._getframe(1)
+        global _expr_globals
 
-        _globals = frame.f_globals.copy()
-        _globals["asm"] = bc
+        try:
+            code = _expr_cache[text]
+        except KeyError:
+            code = _expr_cache[text] = compile(text, "<asm-expr>", "eval")
+
+        if _expr_globals is None:
+            _expr_globals = {**globals(), "asm": bc}
 
-        return eval(text, _globals, frame.f_locals)  # nosec
+        # Expressions only see these globals, and none of the parser locals
+        return eval(code, _expr_globals, {})  # nosec
 
     def parse_opcode_arg(self, text: str) -> t.Union[bc.Label, str, int, t.Any]:
         if not text:
             return bc.UNSET
 
-        return (
-            self.parse_label_ref(text)
-            or self.parse_string_ref(text)
-            or self.parse_number(text)
-            or self.parse_expr(text)
-        )
-
-    def parse_bind_opcode_arg(self, text: str) -> t.Optional[str]:
-        if not text.startswith("{") or not text.endswith("}"):
-            return None
+        c = text[0]
+        if c == "@":
+            return self.parse_label_ref(text)
+        if c == "$":
+            return self.parse_string_ref(text)
+        if c in _DIGITS:
+            try:
+                return int(text)
+            except ValueError:
+                # Could still be a valid expression, e.g. a float
+                pass
 
-        return text[1:-1]
+        return self.parse_expr(text)
 
-    def parse_instruction(self, line: str) -> t.Optional[t.Union[bc.Instr, BindOpArg]]:
-        opcode, *args = line.split(maxsplit=1)
+    def parse_instruction(
+        self, opcode: str, arg: str = "", bind_arg: t.Optional[str] = None
+    ) -> t.Union[bc.Instr, BindOpArg]:
+        opcode = opcode.upper()
+        if opcode not in _OPCODES:
+            raise ValueError("unknown opcode %s" % opcode)
 
-        arg = ""
-        if args:
-            (arg,) = args
-            bind_arg = self.parse_bind_opcode_arg(arg)
-            if bind_arg is not None:
-                return BindOpArg(self.parse_opcode(opcode), bind_arg, lineno=self._lineno)
+        if bind_arg is not None:
+            return BindOpArg(opcode, bind_arg, lineno=self._lineno)
 
-        return bc.Instr(
-            *transform_instruction(self.parse_opcode(opcode), self.parse_opcode_arg(arg)), lineno=self._lineno
-        )
+        return make_instruction(opcode, self.parse_opcode_arg(arg), lineno=self._lineno)
 
     def parse_line(self, line: str) -> ParsedLine:
+        m = _LINE_RE.fullmatch(line)
+        if m is None:
+            raise ValueError("invalid line %s" % line)
+
+        opcode = m["opcode"]
+        if opcode is not None:
+            return self.parse_instruction(opcode, m["arg"] or "", m["bind_arg"])
+
+        label = m["label"]
+        if label is not None:
+            return self.parse_label(label)
+
         if sys.version_info >= (3, 11):
-            entry = (
-                self.parse_label(line)
-                or self.parse_try_begin(line)
-                or self.parse_try_end(line)
-                or self.parse_instruction(line)
-            )
-        else:
-            entry = self.parse_label(line) or self.parse_instruction(line)
+            if m["tried"] is not None:
+                return self.parse_try_end()
 
-        if entry is None:
-            raise ValueError("invalid line %s" % line)
+            return self.parse_try_begin(m["try_label_ref"], lasti=m["try_lasti"] is not None)
 
-        return entry
+        raise ValueError("invalid line %s" % line)
 
     def _validate(self) -> None:
         if self._ref_labels:
             raise ValueError("undefined labels: %s" % ", ".join(self._ref_labels))
 
     def parse(self, asm: str) -> None:
-        for line in (_.strip() for _ in asm.splitlines()):
-            if not line or line.startswith("#"):
-                continue
+        self._compile_cache.clear()
+
+        # Resolve the attributes used for every line only once
+        parse_line = self.parse_line
+        instrs = self._instrs
+        bind_opargs = self._bind_opargs
 
-            entry = self.parse_line(line)
-            if isinstance(entry, BindOpArg):
-                self._bind_opargs[len(self._instrs)] = entry
+        for m in _SOURCE_LINE_RE.finditer(asm):
+            entry = parse_line(m[1])
+            if type(entry) is BindOpArg:
+                bind_opargs[len(instrs)] = entry
 
-            self._instrs.append(entry)
+            instrs.append(entry)
 
         self._validate()
 
@@ -246,29 +309,55 @@ class Assembly:
         # If we have bind opargs, the bytecode we parsed has some
         # BindOpArg placeholders that need to be resolved. Therefore, we
         # make a copy of the parsed bytecode and replace the BindOpArg
-        # placeholders with the resolved values.
-        instrs = bc.Bytecode(self._instrs)
-        for i, arg in self._bind_opargs.items():
-            instrs[i] = arg(bind_args, lineno=lineno)
+        # placeholders with the resolved values. Bytecode.copy avoids going
+        # through the checks of Bytecode.__iter__, and keeps the code
+        # attributes (name, filename, ...) of the assembly, like all the
+        # other ways of binding.
+        if lineno is None:
+            instrs = self._instrs.copy()
+            for i, arg in self._bind_opargs.items():
+                instrs[i] = arg(bind_args)
+
+            return instrs
+
+        # If we also need to relocate, we resolve the placeholders while we
+        # copy the instructions, so that each of them is copied only once.
+        instrs = bc.Bytecode()
+        instrs._copy_attr_from(self._instrs)
+        for entry in self._instrs:
+            if type(entry) is BindOpArg:
+                entry = entry(bind_args, lineno=lineno)
+            elif type(entry) is bc.Instr:
+                entry = entry.copy()
+                entry.lineno = lineno
+            instrs.append(entry)
 
-        return relocate(instrs, lineno) if lineno is not None else instrs
+        return instrs
 
     def compile(self, bind_args: t.Optional[t.Dict[str, t.Any]] = None, lineno: t.Optional[int] = None) -> CodeType:
-        return self.bind(bind_args, lineno=lineno).to_code()
+        # Code objects are immutable, so we can return the same one for the
+        # same bind arguments. Note that the cache keeps the bind arguments
+        # alive for as long as the corresponding entry is cached.
+        try:
+            key = (lineno, tuple((k, _bind_arg_key(v)) for k, v in sorted(bind_args.items())) if bind_args else ())
+        except TypeError:
+            # Some bind arguments cannot be keyed reliably, so we cannot cache
+            return self.bind(bind_args, lineno=lineno).to_code()
 
-    def _label_ident(self, label: bc.Label) -> str:
-        return next(ident for ident, l in self._labels.items() if l is label)
+        return self._compile_cache.get(key, lambda _: self.bind(bind_args, lineno=lineno).to_code())
 
     def dis(self) -> None:
+        label_idents = {id(label): ident for ident, label in self._labels.items()}
+
         for entry in self._instrs:
-            if isinstance(entry, bc.Instr):
+            if type(entry) is bc.Instr:
                 print(f"    {entry.name:<32}{entry.arg if entry.arg is not None else ''}")
-            elif isinstance(entry, BindOpArg):
+            elif type(entry) is BindOpArg:
                 print(f"    {entry.name:<32}{{{entry.arg}}}")
-            elif isinstance(entry, bc.Label):
-                print(f"{self._label_ident(entry)}:")
-            elif isinstance(entry, bc.TryBegin):
-                print(f"try @{self._label_ident(entry.target)} (lasti={entry.push_lasti})")
+            elif type(entry) is bc.Label:
+                print(f"{label_idents[id(entry)]}:")
+            elif type(entry) is bc.TryBegin:
+                print(f"try @{label_idents[id(entry.target)]} (lasti={entry.push_lasti})")
 
     def __iter__(self) -> t.Iterator[bc.Instr]:
         return iter(self._instrs)
@@ -1,5 +1,6 @@
 import sys
 
+import bytecode as bc
 import pytest
 
 from ddtrace.internal.assembly import Assembly
@@ -58,3 +59,110 @@ def test_assembly_lazy_opargs():
 
     exec(asm.compile(dict(text="hello world")))
     exec(asm.compile(dict(text=asm)))
+
+
+def test_assembly_parse_not_shared():
+    source = r"""
+        start:
+            load_const      None
+        """
+
+    asm1 = Assembly()
+    asm1.parse(source)
+
+    asm2 = Assembly()
+    asm2.parse(source)
+
+    # Assemblies parsed from the same source must not share any entries
+    assert asm1._labels["start"] is not asm2._labels["start"]
+    assert all(a is not b for a, b in zip(asm1, asm2))
+
+
+def test_assembly_expr_nested_scopes():
+    asm = Assembly()
+    asm.parse(
+        r"""
+            load_const      [asm.Compare.EQ for _ in range(2)]
+            load_const      (lambda: asm.Compare.NE)()
+        """
+    )
+
+    assert [_.arg for _ in asm] == [[bc.Compare.EQ] * 2, bc.Compare.NE]
+
+
+def test_assembly_expr_no_parser_locals():
+    asm = Assembly()
+    with pytest.raises(NameError):
+        asm.parse("load_const c")
+
+
+def test_assembly_line_breaks():
+    asm = Assembly()
+    asm.parse("load_const 1\rload_const 2\r\nload_const 3\x0bload_const 4   # comment\x0cload_const 5")
+
+    assert [_.arg for _ in asm] == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize("ident", ["1start", "st-art", "stärt"])
+def test_assembly_invalid_label(ident):
+    asm = Assembly()
+    with pytest.raises(ValueError, match="invalid identifier"):
+        asm.parse("%s:" % ident)
+
+
+@pytest.mark.skipif(sys.version_info[:2] != (3, 11), reason="targets CPython 3.11 bytecode")
+def test_assembly_bind_code_attributes():
+    with_args = Assembly(name="with_args")
+    with_args.parse(
+        r"""
+            resume          0
+            load_const      {value}
+            return_value
+        """
+    )
+
+    without_args = Assembly(name="without_args")
+    without_args.parse(
+        r"""
+            resume          0
+            load_const      None
+            return_value
+        """
+    )
+
+    for lineno in (None, 42):
+        assert with_args.compile(dict(value=1), lineno=lineno).co_name == "with_args"
+        assert without_args.compile(lineno=lineno).co_name == "without_args"
+
+
+@pytest.mark.skipif(sys.version_info[:2] != (3, 11), reason="targets CPython 3.11 bytecode")
+def test_assembly_compile_cached():
+    asm = Assembly()
+    asm.parse(
+        r"""
+            resume          0
+            load_const      {value}
+            return_value
+        """
+    )
+
+    code = asm.compile(dict(value=1))
+    assert asm.compile(dict(value=1)) is code
+    assert asm.compile(dict(value=1), lineno=42) is not code
+    assert eval(asm.compile(dict(value=True))) is True
+
+    # Equal values that compile differently are keyed apart
+    assert eval(asm.compile(dict(value=(1,)))) == (1,)
+    assert eval(asm.compile(dict(value=(True,))))[0] is True
+    assert str(eval(asm.compile(dict(value=0.0)))) == "0.0"
+    assert str(eval(asm.compile(dict(value=-0.0)))) == "-0.0"
+
+    # Functions are keyed by identity
+    def hook():
+        pass
+
+    assert asm.compile(dict(value=hook)) is asm.compile(dict(value=hook))
+
+    # Unhashable bind arguments are not cached
+    assert eval(asm.compile(dict(value=[]))) == []
+    assert asm.compile(dict(value=[])) is not asm.compile(dict(value=[]))